@@ -1,28 +1,71 @@
 import asyncio
+import os
 import secrets
-import subprocess
+import tempfile
+import threading
+import time
 from aiohttp import web
 import aiohttp
 import logging
 
+from deckyboard.connections import ConnectionManager
+from deckyboard.injectors import PROBED_BACKENDS, YdotoolCliBackend, select_backend
+from deckyboard.keystate import KeyStateTracker
+from deckyboard.layouts import LAYOUTS, NAMED_KEYS, InputEngine, detect_layout
+from deckyboard.profiling import MAX_DURATION, MIN_INTERVAL_MS, ProfilingSession, format_report
+from deckyboard.settings import Settings
+from deckyboard.trace import TraceRecorder
+from deckyboard.watchdog import LoopWatchdog
+
+# Longest pause honoured between two events of a client batch (about one frame)
+MAX_BATCH_DELAY = 0.05
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def _log_path(subdir, name):
+    """Returns a timestamped file path under the plugin's log directory that does not exist yet"""
+    log_dir = os.environ.get('DECKY_PLUGIN_LOG_DIR', tempfile.gettempdir())
+    path = os.path.join(log_dir, subdir, time.strftime(name))
+    root, ext = os.path.splitext(path)
+    suffix = 1
+    while os.path.exists(path):
+        path = f"{root}-{suffix}{ext}"
+        suffix += 1
+    return path
+
 class Plugin:
     async def _main(self):
         self.server_runner = None
         self.server_site = None
         self.access_code = None
         self.connected_clients = set()
-        logger.info("Deckyboard plugin initialized")
+        self.trace_recorder = None
+        self.profiling_session = None
+        self._profiling_timer = None
+        self.connection_manager = ConnectionManager()
+        self.key_state = KeyStateTracker()
+        self.settings = Settings()
+        self.watchdog = LoopWatchdog()
+        self.watchdog.start()
+        self.detected_layout = await asyncio.get_running_loop().run_in_executor(None, detect_layout)
+        self.input_engine = InputEngine(self.settings.get('keyboard_layout') or self.detected_layout)
+        self.injector = YdotoolCliBackend()
+        self.injector_latency = {}
+        logger.info(f"Deckyboard plugin initialized (layout: {self.input_engine.layout})")
         
     async def _unload(self):
         logger.info("Deckyboard plugin unloading")
-        if self.server_site:
-            await self.server_site.stop()
-        if self.server_runner:
-            await self.server_runner.cleanup()
+        self.watchdog.stop()
+        if self.trace_recorder:
+            await self.stop_trace_recording()
+        if self.profiling_session:
+            await self.stop_profiling()
+        await self._shutdown_server()
+        # Held keys are released above, the injector must stay open until then
+        self.injector.close()
     
     async def start_server(self, port=8765):
         """Starts the WebSocket server"""
@@ -33,6 +76,8 @@ class Plugin:
         self.access_code = secrets.token_urlsafe(4)[:6].upper()
         logger.info(f"Starting server with code: {self.access_code}")
         
+        await self._select_injector()
+        
         app = web.Application()
         app.router.add_get('/ws', self.websocket_handler)
         app.router.add_get('/', self.serve_client_page)
@@ -53,6 +98,18 @@ class Plugin:
     
     async def stop_server(self):
         """Stops the server"""
+        await self._shutdown_server()
+        self.injector.close()
+        self.injector = YdotoolCliBackend()
+        self.injector_latency = {}
+        logger.info("Server stopped")
+        return {"success": True}
+    
+    async def _shutdown_server(self):
+        """Closes every connection, releases held keys and stops the HTTP server"""
+        await self.connection_manager.stop()
+        for client in list(self.key_state.clients):
+            await self.release_held_keys(client)
         if self.server_site:
             await self.server_site.stop()
             self.server_site = None
@@ -61,35 +118,150 @@ class Plugin:
             self.server_runner = None
         self.access_code = None
         self.connected_clients.clear()
-        logger.info("Server stopped")
-        return {"success": True}
     
     async def get_server_status(self):
         """Returns server status"""
         return {
             "running": self.server_runner is not None,
             "code": self.access_code,
-            "clients": len(self.connected_clients)
+            "clients": len(self.connected_clients),
+            "loop": self.watchdog.summary(),
+            "injector": {
+                "backend": self.injector.name,
+                "latency_ms": self.injector_latency
+            }
         }
     
+    async def get_loop_metrics(self):
+        """Returns event loop lag histogram and the stacks of recent stalls"""
+        return self.watchdog.metrics()
+    
+    async def get_connections(self):
+        """Returns connection limits, counters, per-connection buffer usage and held keys"""
+        return {**self.connection_manager.stats(), "keys": self.key_state.stats()}
+    
+    async def get_keyboard_layouts(self):
+        """Returns the active, detected and available keyboard layouts"""
+        return {
+            "current": self.input_engine.layout,
+            "detected": self.detected_layout,
+            "configured": self.settings.get('keyboard_layout'),
+            "available": sorted(LAYOUTS),
+        }
+    
+    async def set_keyboard_layout(self, layout=None):
+        """Sets the layout characters are typed with (None follows the system layout)"""
+        if layout is not None and layout not in LAYOUTS:
+            return {"success": False, "error": f"Unknown layout: {layout}"}
+        
+        self.settings.set('keyboard_layout', layout)
+        self.input_engine = InputEngine(layout or self.detected_layout)
+        logger.info(f"Keyboard layout set to {self.input_engine.layout}")
+        return {"success": True, "layout": self.input_engine.layout}
+    
+    async def set_injector_backend(self, backend=None):
+        """Forces an injector backend (None picks the fastest available one at server start)"""
+        if backend is not None and backend not in PROBED_BACKENDS:
+            return {"success": False, "error": f"Unknown injector backend: {backend}"}
+        
+        self.settings.set('injector_backend', backend)
+        if self.server_runner:
+            await self._select_injector()
+        return {"success": True, "backend": self.injector.name, "latency_ms": self.injector_latency}
+    
+    async def _select_injector(self):
+        """Probes the injector backends and switches to the selected one"""
+        # The current backend keeps serving injections while the others are probed
+        injector, latency = await select_backend(self.settings.get('injector_backend'))
+        if injector is None:
+            logger.warning("No injector backend available, falling back to the ydotool CLI")
+            injector = YdotoolCliBackend()
+        previous, self.injector = self.injector, injector
+        self.injector_latency = latency
+        previous.close()
+        logger.info(f"Using injector backend {injector.name} (calibration: {self.injector_latency})")
+    
+    async def start_trace_recording(self):
+        """Starts recording every received WebSocket frame to a trace file"""
+        if self.trace_recorder:
+            return {"success": False, "error": "Trace recording already running"}
+        
+        path = _log_path('traces', 'trace-%Y%m%d-%H%M%S.jsonl')
+        self.trace_recorder = TraceRecorder(path)
+        logger.info(f"Trace recording started: {path}")
+        return {"success": True, "path": path}
+    
+    async def stop_trace_recording(self):
+        """Stops the trace recording and returns the trace file path"""
+        if not self.trace_recorder:
+            return {"success": False, "error": "Trace recording not running"}
+        
+        recorder = self.trace_recorder
+        self.trace_recorder = None
+        recorder.close()
+        logger.info(f"Trace recording stopped: {recorder.path} ({recorder.frames} frames)")
+        return {"success": True, "path": recorder.path, "frames": recorder.frames}
+    
+    async def start_profiling(self, duration=30, interval_ms=5):
+        """Starts CPU sampling and allocation tracking for at most `duration` seconds"""
+        if self.profiling_session:
+            return {"success": False, "error": "Profiling already running"}
+        
+        duration = min(max(duration, 1), MAX_DURATION)
+        interval_ms = max(interval_ms, MIN_INTERVAL_MS)
+        self.profiling_session = ProfilingSession(threading.get_ident(), interval_ms / 1000)
+        self.profiling_session.start()
+        loop = asyncio.get_running_loop()
+        self._profiling_timer = loop.call_later(duration, lambda: asyncio.ensure_future(self.stop_profiling()))
+        logger.info(f"Profiling started for {duration}s")
+        return {"success": True, "duration": duration, "interval_ms": interval_ms}
+    
+    async def stop_profiling(self):
+        """Stops profiling and writes the report to the plugin log directory"""
+        if not self.profiling_session:
+            return {"success": False, "error": "Profiling not running"}
+        
+        session = self.profiling_session
+        self.profiling_session = None
+        self._profiling_timer.cancel()
+        self._profiling_timer = None
+        
+        report = await asyncio.get_running_loop().run_in_executor(None, session.stop)
+        path = _log_path('profiles', 'profile-%Y%m%d-%H%M%S.txt')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'x', encoding='utf-8') as f:
+            f.write(format_report(report))
+        logger.info(f"Profiling stopped, report written to {path}")
+        return {"success": True, "path": path, **report}
+    
     async def websocket_handler(self, request):
         """Gère les connexions WebSocket"""
-        ws = web.WebSocketResponse()
+        if self.connection_manager.is_full():
+            self.connection_manager.reject()
+            logger.warning(f"Rejected connection from {request.remote}: too many connections")
+            return web.Response(status=503, text="Too many connections")
+        
+        ws = web.WebSocketResponse(**self.connection_manager.ws_options())
         await ws.prepare(request)
         
-        authenticated = False
+        conn = self.connection_manager.register(ws, request)
         logger.info("New WebSocket connection")
         
         try:
             async for msg in ws:
                 if msg.type == aiohttp.WSMsgType.TEXT:
+                    conn.touch(len(msg.data))
+                    if self.trace_recorder:
+                        # Le code d'accès n'est jamais écrit dans la trace
+                        frame = msg.data if conn.authenticated else '{"type":"auth"}'
+                        self.trace_recorder.record(conn.id, frame)
                     try:
                         data = msg.json()
                         
-                        if not authenticated:
+                        if not conn.authenticated:
                             if data.get('type') == 'auth':
                                 if data.get('code') == self.access_code:
-                                    authenticated = True
+                                    self.connection_manager.authenticated(conn)
                                     self.connected_clients.add(ws)
                                     await ws.send_json({"type": "auth_success"})
                                     logger.info("Client authenticated")
@@ -100,11 +272,17 @@ class Plugin:
                                     break
                             continue
                         
-                        if data.get('type') == 'keydown':
-                            await self.inject_key(data['key'], data.get('modifiers', []), press=True)
-                        elif data.get('type') == 'keyup':
-                            await self.inject_key(data['key'], data.get('modifiers', []), press=False)
+                        if data.get('type') == 'batch':
+                            events = data.get('events')
+                            if not isinstance(events, list):
+                                logger.warning(f"Rejected batch without an event list: {events!r}")
+                                await ws.send_json({"type": "error", "message": "Batch events must be a list"})
+                                continue
+                            await self.inject_batch(events, conn.id)
+                            await ws.send_json({"type": "ack", "count": len(events)})
+                            continue
                         
+                        await self.inject_event(data, conn.id)
                         await ws.send_json({"type": "ack", "key": data['key']})
                     
                     except Exception as e:
@@ -121,41 +299,63 @@ class Plugin:
         finally:
             if ws in self.connected_clients:
                 self.connected_clients.remove(ws)
+            self.connection_manager.unregister(conn)
+            await self.release_held_keys(conn.id)
             logger.info("WebSocket connection closed")
         
         return ws
     
+    async def inject_event(self, data, client=None):
+        """Injects one keydown/keyup message, dropping redundant held-key transitions"""
+        key = data['key']
+        if data.get('type') == 'keydown':
+            if key in NAMED_KEYS and not self.key_state.press(client, key):
+                return
+            await self.inject_key(key, data.get('modifiers', []), press=True)
+        elif data.get('type') == 'keyup':
+            if key in NAMED_KEYS and not self.key_state.release(client, key):
+                return
+            await self.inject_key(key, data.get('modifiers', []), press=False)
+    
+    async def inject_batch(self, events, client=None):
+        """Injects a batch of events, keeping their relative timing offsets (`t`, in ms)"""
+        start = time.monotonic()
+        for event in events:
+            if not isinstance(event, dict) or not isinstance(event.get('key'), str):
+                logger.warning(f"Skipping malformed batch event: {event!r}")
+                continue
+            try:
+                offset = float(event.get('t', 0)) / 1000
+            except (TypeError, ValueError):
+                offset = 0
+            # Un lot couvre une frame : on ne respecte pas un décalage plus long
+            delay = min(offset - (time.monotonic() - start), MAX_BATCH_DELAY)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.inject_event(event, client)
+    
+    async def release_held_keys(self, client):
+        """Releases, in one injection, every key still held down by a client"""
+        keys = self.key_state.release_all(client)
+        if not keys:
+            return
+        try:
+            await self.injector.send([(NAMED_KEYS[key], 0) for key in keys])
+            logger.info(f"Released held keys: {', '.join(keys)}")
+        except Exception as e:
+            logger.error(f"Error releasing held keys: {e}")
+    
     async def inject_key(self, key, modifiers, press=True):
-        """Inject key via ydotool"""
+        """Inject key via the selected injector backend"""
         try:
-            key_map = {
-                'Enter': '28',
-                'Backspace': '14',
-                'Tab': '15',
-                'Escape': '1',
-                'ArrowUp': '103',
-                'ArrowDown': '108',
-                'ArrowLeft': '105',
-                'ArrowRight': '106',
-                'Delete': '111',
-                'Home': '102',
-                'End': '107',
-                'PageUp': '104',
-                'PageDown': '109',
-                'Insert': '110',
-                'Space': '57',
-            }
-            
-            if key in key_map:
-                keycode = key_map[key]
-                action = '1' if press else '0'
-                subprocess.run(['ydotool', 'key', f'{keycode}:{action}'], 
-                             capture_output=True, check=False)
+            if key in NAMED_KEYS:
+                keycode = NAMED_KEYS[key]
+                action = 1 if press else 0
+                await self.injector.send([(keycode, action)])
                 logger.info(f"Injected key: {key} ({keycode}:{action})")
             else:
                 if press and len(key) == 1:
-                    subprocess.run(['ydotool', 'type', key], 
-                                 capture_output=True, check=False)
+                    await self.injector.send(self.input_engine.events(key))
                     logger.info(f"Typed character: {key}")
         
         except Exception as e:
@@ -232,6 +432,37 @@ class Plugin:
         let ws = null;
         let authenticated = false;
         
+        // Les événements sont envoyés par lot, une fois par frame
+        let queue = [];
+        let batchStart = 0;
+        let flushScheduled = false;
+        
+        function enqueue(event) {
+            const now = performance.now();
+            if (queue.length === 0) {
+                batchStart = now;
+            }
+            event.t = Math.round((now - batchStart) * 10) / 10;
+            queue.push(event);
+            
+            if (!flushScheduled) {
+                flushScheduled = true;
+                if (document.hidden) {
+                    setTimeout(flush, 16);
+                } else {
+                    requestAnimationFrame(flush);
+                }
+            }
+        }
+        
+        function flush() {
+            flushScheduled = false;
+            if (queue.length > 0 && authenticated && ws && ws.readyState === WebSocket.OPEN) {
+                ws.send(JSON.stringify({ type: 'batch', events: queue }));
+            }
+            queue = [];
+        }
+        
         function authenticate() {
             const code = document.getElementById('code-input').value.toUpperCase();
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
@@ -244,7 +475,6 @@ class Plugin:
             
             ws.onmessage = (event) => {
                 const data = JSON.parse(event.data);
-                console.log('Received:', data);
                 
                 if (data.type === 'auth_success') {
                     authenticated = true;
@@ -285,7 +515,7 @@ class Plugin:
                     e.preventDefault();
                 }
                 
-                const message = {
+                enqueue({
                     type: 'keydown',
                     key: e.key,
                     modifiers: [
@@ -293,21 +523,16 @@ class Plugin:
                         e.altKey ? 'alt' : null,
                         e.shiftKey ? 'shift' : null
                     ].filter(Boolean)
-                };
-                
-                console.log('Sending:', message);
-                ws.send(JSON.stringify(message));
+                });
             });
             
             input.addEventListener('keyup', (e) => {
                 if (!authenticated || !ws || ws.readyState !== WebSocket.OPEN) return;
                 
-                const message = {
+                enqueue({
                     type: 'keyup',
                     key: e.key
-                };
-                
-                ws.send(JSON.stringify(message));
+                });
             });
         });
     </script>
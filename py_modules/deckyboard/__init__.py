@@ -0,0 +1 @@
+"""Backend helpers for the Deckyboard plugin (imported from main.py via py_modules)."""
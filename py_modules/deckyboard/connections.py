@@ -0,0 +1,138 @@
+"""WebSocket connection bookkeeping and resource limits.
+
+Frame size limits and heartbeats are enforced by aiohttp itself (the manager
+only supplies the values): a client that stops answering pings, e.g. after a
+Wi-Fi drop, is closed by aiohttp and then reaped here. The auth deadline is
+enforced here as well.
+"""
+import asyncio
+import itertools
+import time
+
+from aiohttp import WSCloseCode
+
+MAX_CONNECTIONS = 4
+AUTH_TIMEOUT = 10.0
+MAX_MESSAGE_SIZE = 16 * 1024
+HEARTBEAT = 15.0
+CLOSE_TIMEOUT = 2.0
+
+
+def _read_queue_usage(ws):
+    """Returns (bytes, messages) waiting in the WebSocket's read queue
+
+    aiohttp has no public API for this: it reads the private WebSocketDataQueue
+    attributes of aiohttp 3.x and reports zeros if a future version renames them.
+    """
+    reader = getattr(ws, '_reader', None)
+    return getattr(reader, '_size', 0), len(getattr(reader, '_buffer', ()))
+
+
+class Connection:
+    """State tracked for one WebSocket connection"""
+
+    def __init__(self, connection_id, ws, remote, transport):
+        self.id = connection_id
+        self.ws = ws
+        self.remote = remote
+        self.transport = transport
+        self.authenticated = False
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        self.frames = 0
+        self.bytes_received = 0
+        self._auth_timer = None
+
+    def touch(self, size):
+        self.last_seen = time.monotonic()
+        self.frames += 1
+        self.bytes_received += size
+
+    def stats(self):
+        """Returns the connection's counters and current buffer usage"""
+        now = time.monotonic()
+        queue_bytes, queue_messages = _read_queue_usage(self.ws)
+        return {
+            "id": self.id,
+            "remote": self.remote,
+            "authenticated": self.authenticated,
+            "age_s": round(now - self.connected_at, 1),
+            "idle_s": round(now - self.last_seen, 1),
+            "frames": self.frames,
+            "bytes_received": self.bytes_received,
+            "read_queue_bytes": queue_bytes,
+            "read_queue_messages": queue_messages,
+            "write_buffer_bytes": self.transport.get_write_buffer_size() if self.transport else 0,
+        }
+
+
+class ConnectionManager:
+    """Admits, tracks and reaps WebSocket connections within fixed limits"""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, auth_timeout=AUTH_TIMEOUT,
+                 max_message_size=MAX_MESSAGE_SIZE, heartbeat=HEARTBEAT):
+        self.max_connections = max_connections
+        self.auth_timeout = auth_timeout
+        self.max_message_size = max_message_size
+        self.heartbeat = heartbeat
+        self.connections = {}
+        self.rejected = 0
+        self.reaped = 0
+        self._ids = itertools.count(1)
+
+    def is_full(self):
+        return len(self.connections) >= self.max_connections
+
+    def reject(self):
+        self.rejected += 1
+
+    def ws_options(self):
+        """Keyword arguments for web.WebSocketResponse"""
+        # `timeout` bounds how long close() waits for the peer's CLOSE frame
+        return {"max_msg_size": self.max_message_size, "heartbeat": self.heartbeat, "timeout": CLOSE_TIMEOUT}
+
+    def register(self, ws, request):
+        """Tracks a new connection and arms its auth deadline"""
+        conn = Connection(next(self._ids), ws, request.remote, request.transport)
+        self.connections[conn.id] = conn
+        loop = asyncio.get_running_loop()
+        conn._auth_timer = loop.call_later(self.auth_timeout, self._auth_expired, conn)
+        return conn
+
+    def authenticated(self, conn):
+        conn.authenticated = True
+        if conn._auth_timer:
+            conn._auth_timer.cancel()
+            conn._auth_timer = None
+
+    def unregister(self, conn):
+        if conn._auth_timer:
+            conn._auth_timer.cancel()
+            conn._auth_timer = None
+        if self.connections.pop(conn.id, None) and isinstance(conn.ws.exception(), asyncio.TimeoutError):
+            # aiohttp closes the socket with a TimeoutError when a heartbeat pong never arrives
+            self.reaped += 1
+
+    def _auth_expired(self, conn):
+        conn._auth_timer = None
+        if not conn.authenticated and not conn.ws.closed:
+            self.reaped += 1
+            asyncio.ensure_future(conn.ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b'Auth timeout'))
+
+    async def stop(self):
+        """Closes every tracked connection"""
+        connections = list(self.connections.values())
+        await asyncio.gather(
+            *[conn.ws.close(code=WSCloseCode.GOING_AWAY, message=b'Server stopped') for conn in connections],
+            return_exceptions=True)
+        for conn in connections:
+            self.unregister(conn)
+
+    def stats(self):
+        return {
+            "connections": len(self.connections),
+            "max_connections": self.max_connections,
+            "rejected": self.rejected,
+            "reaped": self.reaped,
+            "clients": [conn.stats() for conn in self.connections.values()],
+        }
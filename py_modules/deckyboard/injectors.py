@@ -0,0 +1,226 @@
+"""Key injector backends.
+
+Every backend sends a sequence of evdev key events, given as (keycode, value)
+pairs where value is 1 for press and 0 for release. select_backend probes the
+available backends at server start, times a few calibration events on each and
+keeps the fastest one.
+"""
+import abc
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+EV_SYN = 0
+EV_KEY = 1
+SYN_REPORT = 0
+
+# struct input_event on 64-bit: struct timeval, __u16 type, __u16 code, __s32 value
+INPUT_EVENT = struct.Struct('llHHi')
+
+CALIBRATION_KEY = 42  # KEY_LEFTSHIFT, pressing and releasing it alone types nothing
+CALIBRATION_ROUNDS = 5
+
+
+def _input_events(events):
+    """Packs key events into input_event structs, each followed by a SYN_REPORT"""
+    data = b''
+    for code, value in events:
+        data += INPUT_EVENT.pack(0, 0, EV_KEY, code, value)
+        data += INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+    return data
+
+
+class InjectorBackend(abc.ABC):
+    """Base class for key injectors"""
+
+    name = None
+
+    @abc.abstractmethod
+    async def available(self):
+        """Returns whether the backend can inject on this system"""
+
+    @abc.abstractmethod
+    async def send(self, events):
+        """Injects a sequence of (keycode, value) key events"""
+
+    def close(self):
+        pass
+
+
+class YdotoolCliBackend(InjectorBackend):
+    """Runs one `ydotool key` process per event sequence"""
+
+    name = 'ydotool'
+
+    async def available(self):
+        return shutil.which('ydotool') is not None
+
+    async def send(self, events):
+        process = await asyncio.create_subprocess_exec(
+            'ydotool', 'key', *[f'{code}:{value}' for code, value in events],
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            # e.g. ydotool 1.x exits with an error when ydotoold is not running
+            raise RuntimeError(f"ydotool exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+
+
+class YdotooldSocketBackend(InjectorBackend):
+    """Writes input_event structs straight to a running ydotoold's socket"""
+
+    name = 'ydotoold'
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('YDOTOOL_SOCKET', '/tmp/.ydotool_socket')
+        self._socket = None
+
+    async def available(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.connect(self.path)
+        except OSError:
+            self.close()
+            return False
+        return True
+
+    async def send(self, events):
+        # ydotoold reads exactly one input_event per datagram
+        data = _input_events(events)
+        for offset in range(0, len(data), INPUT_EVENT.size):
+            self._socket.send(data[offset:offset + INPUT_EVENT.size])
+
+    def close(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+
+class UinputBackend(InjectorBackend):
+    """Creates its own virtual keyboard through /dev/uinput"""
+
+    name = 'uinput'
+
+    UI_SET_EVBIT = 0x40045564
+    UI_SET_KEYBIT = 0x40045565
+    UI_DEV_SETUP = 0x405c5503
+    UI_DEV_CREATE = 0x5501
+    UI_DEV_DESTROY = 0x5502
+    BUS_USB = 0x03
+    KEY_MAX = 248
+
+    def __init__(self, path='/dev/uinput'):
+        self.path = path
+        self._fd = None
+
+    async def available(self):
+        try:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            fcntl.ioctl(self._fd, self.UI_SET_EVBIT, EV_KEY)
+            for code in range(1, self.KEY_MAX):
+                fcntl.ioctl(self._fd, self.UI_SET_KEYBIT, code)
+            setup = struct.pack('HHHH80sI', self.BUS_USB, 0x1209, 0xdeb0, 1, b'Deckyboard virtual keyboard', 0)
+            fcntl.ioctl(self._fd, self.UI_DEV_SETUP, setup)
+            fcntl.ioctl(self._fd, self.UI_DEV_CREATE)
+        except OSError:
+            self.close()
+            return False
+        # Leave the compositor time to pick up the new device before the first event
+        await asyncio.sleep(0.2)
+        return True
+
+    async def send(self, events):
+        os.write(self._fd, _input_events(events))
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                fcntl.ioctl(self._fd, self.UI_DEV_DESTROY)
+            except OSError:
+                pass
+            os.close(self._fd)
+            self._fd = None
+
+
+class RecordingBackend(InjectorBackend):
+    """Keeps injected events in memory instead of sending them, for tests and replays
+
+    It is never selected by select_backend, callers install it themselves.
+    """
+
+    name = 'recording'
+
+    def __init__(self):
+        self.events = []
+
+    async def available(self):
+        return True
+
+    async def send(self, events):
+        self.events.extend(events)
+
+
+BACKENDS = {cls.name: cls for cls in (UinputBackend, YdotooldSocketBackend, YdotoolCliBackend)}
+
+# Order in which select_backend probes the backends
+PROBED_BACKENDS = ['uinput', 'ydotoold', 'ydotool']
+
+
+async def _calibrate(backend):
+    """Returns the mean latency in ms of sending a press/release pair"""
+    timings = []
+    for _ in range(CALIBRATION_ROUNDS):
+        start = time.perf_counter()
+        await backend.send([(CALIBRATION_KEY, 1), (CALIBRATION_KEY, 0)])
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(sum(timings) / len(timings), 3)
+
+
+async def select_backend(preferred=None):
+    """Probes the backends and returns (backend, measurements)
+
+    `measurements` maps each probed backend name to its mean calibration latency
+    in ms, or None when it is not available. A preferred backend that is
+    available is used regardless of its latency, an unknown one is ignored.
+    """
+    if preferred is not None and preferred not in PROBED_BACKENDS:
+        logger.warning(f"Unknown injector backend {preferred}, picking the fastest one")
+        preferred = None
+    measurements = {}
+    candidates = {}
+    for name in PROBED_BACKENDS:
+        backend = None
+        try:
+            backend = BACKENDS[name]()
+            if not await backend.available():
+                measurements[name] = None
+                continue
+            measurements[name] = await _calibrate(backend)
+            candidates[name] = backend
+        except Exception as e:
+            logger.warning(f"Injector backend {name} failed calibration: {e}")
+            measurements[name] = None
+            if backend:
+                backend.close()
+
+    if preferred in candidates:
+        chosen = preferred
+    elif candidates:
+        if preferred:
+            logger.warning(f"Preferred injector backend {preferred} is not available")
+        chosen = min(candidates, key=measurements.get)
+    else:
+        chosen = None
+
+    for name, backend in candidates.items():
+        if name != chosen:
+            backend.close()
+    return candidates.get(chosen), measurements
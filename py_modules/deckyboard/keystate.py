@@ -0,0 +1,59 @@
+"""Authoritative pressed-key state per client and across clients.
+
+Only keys that are held on the Deck between keydown and keyup go through the
+tracker; characters are typed as a full press/release on keydown.
+"""
+import collections
+
+
+class KeyStateTracker:
+    """Filters redundant key transitions and remembers what each client holds"""
+
+    def __init__(self):
+        self.clients = collections.defaultdict(set)
+        self.held = collections.Counter()
+        self.dropped = 0
+
+    def press(self, client, key):
+        """Records a keydown, returns whether it must be injected"""
+        if key in self.clients[client]:
+            self.dropped += 1
+            return False
+        self.clients[client].add(key)
+        self.held[key] += 1
+        if self.held[key] > 1:
+            # Already held down on the Deck by another client
+            self.dropped += 1
+            return False
+        return True
+
+    def release(self, client, key):
+        """Records a keyup, returns whether it must be injected"""
+        keys = self.clients.get(client)
+        if not keys or key not in keys:
+            self.dropped += 1
+            return False
+        keys.remove(key)
+        if not keys:
+            del self.clients[client]
+        return self._release_global(key)
+
+    def release_all(self, client):
+        """Forgets every key the client holds, returns the ones to release on the Deck"""
+        keys = self.clients.pop(client, set())
+        return [key for key in sorted(keys) if self._release_global(key)]
+
+    def _release_global(self, key):
+        self.held[key] -= 1
+        if self.held[key] > 0:
+            self.dropped += 1
+            return False
+        del self.held[key]
+        return True
+
+    def stats(self):
+        return {
+            "held": sorted(self.held),
+            "clients": {client: sorted(keys) for client, keys in self.clients.items()},
+            "dropped": self.dropped,
+        }
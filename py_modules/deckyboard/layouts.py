@@ -0,0 +1,186 @@
+"""Character to key sequence tables for the keyboard layouts we inject into.
+
+Injectors send raw evdev keycodes, so the character a keycode produces depends
+on the layout active on the Deck. Each layout below lists, per modifier level,
+the characters produced by the keys of the four main rows. A space means the
+key produces nothing at that level; a combining character (e.g. U+0302)
+marks a dead key. Tables are built once per layout and shared by every
+InputEngine, and the resolved key events for each of their characters are
+cached. Characters typed through Unicode entry are resolved on every use.
+"""
+import logging
+import subprocess
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+KEY_LEFTCTRL = 29
+KEY_LEFTSHIFT = 42
+KEY_RIGHTALT = 100  # AltGr
+KEY_ENTER = 28
+KEY_TAB = 15
+KEY_SPACE = 57
+
+ROWS = [
+    [41, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13],
+    [16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 43],
+    [30, 31, 32, 33, 34, 35, 36, 37, 38, 39, 40],
+    [86, 44, 45, 46, 47, 48, 49, 50, 51, 52, 53],
+]
+
+LEVELS = [
+    ('base', ()),
+    ('shift', (KEY_LEFTSHIFT,)),
+    ('altgr', (KEY_RIGHTALT,)),
+]
+
+LAYOUTS = {
+    'us': {
+        'base': ["`1234567890-=", "qwertyuiop[]\\", "asdfghjkl;'", " zxcvbnm,./"],
+        'shift': ["~!@#$%^&*()_+", "QWERTYUIOP{}|", 'ASDFGHJKL:"', " ZXCVBNM<>?"],
+    },
+    'gb': {
+        'base': ["`1234567890-=", "qwertyuiop[]#", "asdfghjkl;'", "\\zxcvbnm,./"],
+        'shift': ["¬!\"£$%^&*()_+", "QWERTYUIOP{}~", "ASDFGHJKL:@", "|ZXCVBNM<>?"],
+        'altgr': ["¦   €        "],
+    },
+    'fr': {
+        'base': ["²&é\"'(-è_çà)=", "azertyuiop\u0302$*", "qsdfghjklmù", "<wxcvbn,;:!"],
+        'shift': [" 1234567890°+", "AZERTYUIOP\u0308£µ", "QSDFGHJKLM%", ">WXCVBN?./§"],
+        'altgr': ["  ~#{[|`\\^@]}", "  €        ¤ "],
+    },
+    'de': {
+        'base': ["\u03021234567890ß\u0301", "qwertzuiopü+#", "asdfghjklöä", "<yxcvbnm,.-"],
+        'shift': ["°!\"§$%&/()=?\u0300", "QWERTZUIOPÜ*'", "ASDFGHJKLÖÄ", ">YXCVBNM;:_"],
+        'altgr': ["  ²³   {[]}\\ ", "@ €        ~ ", "           ", "|      µ   "],
+    },
+    'es': {
+        'base': ["º1234567890'¡", "qwertyuiop\u0300+ç", "asdfghjklñ\u0301", "<zxcvbnm,.-"],
+        'shift': ["ª!\"·$%&/()=?¿", "QWERTYUIOP\u0302*Ç", "ASDFGHJKLÑ\u0308", ">ZXCVBNM;:_"],
+        'altgr': ["\\|@#  ¬      ", "  €       []}", "          {"],
+    },
+}
+
+# Keys the client sends by name (KeyboardEvent.key), held between keydown and keyup
+NAMED_KEYS = {
+    'Enter': 28,
+    'Backspace': 14,
+    'Tab': 15,
+    'Escape': 1,
+    'ArrowUp': 103,
+    'ArrowDown': 108,
+    'ArrowLeft': 105,
+    'ArrowRight': 106,
+    'Delete': 111,
+    'Home': 102,
+    'End': 107,
+    'PageUp': 104,
+    'PageDown': 109,
+    'Insert': 110,
+    'Space': 57,
+}
+
+DEFAULT_LAYOUT = 'us'
+
+# Character typed by a dead key followed by space
+SPACING_ACCENTS = {
+    '\u0300': '`',
+    '\u0301': '´',
+    '\u0302': '^',
+    '\u0303': '~',
+    '\u0308': '¨',
+}
+
+_tables = {}
+_events = {}
+
+
+def build_table(layout):
+    """Maps every character the layout can produce to a tuple of (keycode, modifiers) steps"""
+    spec = LAYOUTS[layout]
+    table = {' ': ((KEY_SPACE, ()),), '\n': ((KEY_ENTER, ()),), '\t': ((KEY_TAB, ()),)}
+    dead_keys = {}
+    for level, modifiers in LEVELS:
+        for codes, chars in zip(ROWS, spec.get(level, [])):
+            for code, char in zip(codes, chars):
+                if char == ' ':
+                    continue
+                step = (code, modifiers)
+                if unicodedata.combining(char):
+                    dead_keys.setdefault(char, step)
+                else:
+                    table.setdefault(char, (step,))
+
+    for mark, dead_step in dead_keys.items():
+        for base, steps in list(table.items()):
+            composed = unicodedata.normalize('NFC', base + mark)
+            if len(composed) == 1 and len(steps) == 1 and composed not in table:
+                table[composed] = (dead_step,) + steps
+        spacing = SPACING_ACCENTS.get(mark)
+        if spacing and spacing not in table:
+            table[spacing] = (dead_step, (KEY_SPACE, ()))
+    return table
+
+
+def _table_for(layout):
+    table = _tables.get(layout)
+    if table is None:
+        table = _tables[layout] = build_table(layout)
+        _events[layout] = {}
+        logger.info(f"Built {layout} layout table ({len(table)} characters)")
+    return table
+
+
+def _key_events(steps):
+    events = []
+    for code, modifiers in steps:
+        events += [(m, 1) for m in modifiers]
+        events += [(code, 1), (code, 0)]
+        events += [(m, 0) for m in reversed(modifiers)]
+    return tuple(events)
+
+
+def detect_layout():
+    """Returns the system keyboard layout if it is one we have a table for"""
+    try:
+        result = subprocess.run(['localectl', 'status'], capture_output=True, text=True, timeout=2, check=False)
+    except (OSError, subprocess.TimeoutExpired):
+        return DEFAULT_LAYOUT
+    for line in result.stdout.splitlines():
+        name, _, value = line.strip().partition(':')
+        if name in ('X11 Layout', 'VC Keymap'):
+            layout = value.strip().split(',')[0].split('-')[0]
+            if layout in LAYOUTS:
+                return layout
+    return DEFAULT_LAYOUT
+
+
+class InputEngine:
+    """Resolves characters to (keycode, value) key events for one keyboard layout"""
+
+    def __init__(self, layout=DEFAULT_LAYOUT):
+        if layout not in LAYOUTS:
+            logger.warning(f"Unknown keyboard layout {layout}, using {DEFAULT_LAYOUT}")
+            layout = DEFAULT_LAYOUT
+        self.layout = layout
+        self._table = _table_for(layout)
+        self._events = _events[layout]
+
+    def events(self, char):
+        """Returns the key events that type `char`"""
+        events = self._events.get(char)
+        if events is None:
+            steps = self._table.get(char)
+            if steps is None:
+                # Not cached: any code point can be typed, the cache would grow without bound
+                return _key_events(self._unicode_entry(char))
+            events = self._events[char] = _key_events(steps)
+        return events
+
+    def _unicode_entry(self, char):
+        """Ctrl+Shift+U, the hex code point, then space (GTK and IBus Unicode entry)"""
+        steps = [(self._table['u'][0][0], (KEY_LEFTCTRL, KEY_LEFTSHIFT))]
+        for digit in f'{ord(char):x}':
+            steps += self._table[digit]
+        steps.append((KEY_SPACE, ()))
+        return tuple(steps)
@@ -0,0 +1,130 @@
+"""On-demand CPU sampling and allocation tracking.
+
+Nothing here runs until a ProfilingSession is started: the sampler thread and
+tracemalloc are only active for the duration of a session.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Bounds applied to profiling requests: sampling faster than this starves the
+# event loop of the GIL, and a session may not outlive MAX_DURATION seconds
+MIN_INTERVAL_MS = 1
+MAX_DURATION = 300
+
+
+class SamplingProfiler:
+    """Periodically samples the stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = collections.Counter()
+        self.total_counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="deckyboard-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_counts[_describe(frame)] += 1
+            seen = set()
+            while frame is not None:
+                location = _describe(frame)
+                if location not in seen:
+                    seen.add(location)
+                    self.total_counts[location] += 1
+                frame = frame.f_back
+
+    def top_functions(self, limit=20):
+        """Returns the functions seen most often on top of the stack, with cumulative counts"""
+        return [{
+            "function": location,
+            "self_pct": round(100 * count / self.samples, 2),
+            "total_pct": round(100 * self.total_counts[location] / self.samples, 2),
+        } for location, count in self.self_counts.most_common(limit)]
+
+
+def _describe(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _format_stat(stat):
+    frame = stat.traceback[0]
+    entry = {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+class ProfilingSession:
+    """A bounded CPU sampling and tracemalloc window over one thread"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.profiler = SamplingProfiler(thread_id, interval)
+        self.started = None
+        self._first_snapshot = None
+        self._owns_tracemalloc = False
+
+    def start(self):
+        self.started = time.monotonic()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        self._first_snapshot = tracemalloc.take_snapshot()
+        self.profiler.start()
+
+    def stop(self, limit=20):
+        """Stops sampling and tracing and returns the report dict"""
+        self.profiler.stop()
+        last_snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        first = self._first_snapshot.filter_traces(filters)
+        last = last_snapshot.filter_traces(filters)
+        return {
+            "duration_s": round(time.monotonic() - self.started, 3),
+            "samples": self.profiler.samples,
+            "top_functions": self.profiler.top_functions(limit),
+            "top_allocations": [_format_stat(s) for s in last.statistics('lineno')[:limit]],
+            "allocation_diff": [_format_stat(s) for s in last.compare_to(first, 'lineno')[:limit]],
+        }
+
+
+def format_report(report):
+    """Renders a session report as plain text"""
+    lines = [
+        f"Deckyboard profile: {report['duration_s']}s, {report['samples']} samples",
+        "",
+        "Top functions (self% / total%):",
+    ]
+    lines += [f"  {f['self_pct']:6.2f} {f['total_pct']:6.2f}  {f['function']}" for f in report['top_functions']]
+    lines += ["", "Top allocation sites:"]
+    lines += [f"  {a['size_kb']:10.1f} KiB {a['count']:8d}  {a['location']}" for a in report['top_allocations']]
+    lines += ["", "Allocation growth since start:"]
+    lines += [f"  {a['size_diff_kb']:+10.1f} KiB {a['count_diff']:+8d}  {a['location']}" for a in report['allocation_diff']]
+    return "\n".join(lines) + "\n"
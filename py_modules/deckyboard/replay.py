@@ -0,0 +1,251 @@
+"""Deterministic replay of recorded input traces.
+
+Starts a local Deckyboard server with the recording injector, feeds the trace back
+over one WebSocket per recorded connection at the original (or accelerated)
+pace and reports per-frame latency and injection ordering.
+
+Usage (from the plugin directory):
+    PYTHONPATH=py_modules python -m deckyboard.replay trace.jsonl --speed 2
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import sys
+import time
+
+import aiohttp
+
+from deckyboard.injectors import RecordingBackend
+from deckyboard.keystate import KeyStateTracker
+from deckyboard.layouts import NAMED_KEYS
+from deckyboard.trace import read_trace
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+def _is_auth(frame):
+    try:
+        data = json.loads(frame)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get('type') == 'auth'
+
+
+def _frame_events(frame):
+    """Returns the well-formed keydown/keyup events of a frame, as the server reads them"""
+    try:
+        data = json.loads(frame)
+    except ValueError:
+        return []
+    if not isinstance(data, dict):
+        return []
+    events = data.get('events') if data.get('type') == 'batch' else [data]
+    if not isinstance(events, list):
+        return []
+    return [event for event in events
+            if isinstance(event, dict) and isinstance(event.get('key'), str)
+            and event.get('type') in ('keydown', 'keyup')]
+
+
+def _expected_events(entries, input_engine):
+    """Returns the (keycode, value) key events the given trace entries should inject
+
+    Malformed events are skipped and redundant held-key transitions are filtered
+    per connection, the same way the server does. Keys still held after a
+    connection's last frame are released, as the server does when it closes.
+    """
+    expected = []
+    key_state = KeyStateTracker()
+    last_frames = {connection_id: index for index, (_, connection_id, _) in enumerate(entries)}
+    for index, (_, connection_id, frame) in enumerate(entries):
+        for event in _frame_events(frame):
+            press, key = event['type'] == 'keydown', event['key']
+            if key in NAMED_KEYS:
+                if key_state.press(connection_id, key) if press else key_state.release(connection_id, key):
+                    expected.append((NAMED_KEYS[key], 1 if press else 0))
+            elif press and len(key) == 1:
+                expected.extend(input_engine.events(key))
+        if last_frames[connection_id] == index:
+            expected.extend((NAMED_KEYS[key], 0) for key in key_state.release_all(connection_id))
+    return expected
+
+
+class _ReplayClient:
+    """One replayed connection, timing the server's reply to each frame it sends"""
+
+    def __init__(self, ws, latencies):
+        self.ws = ws
+        self.latencies = latencies
+        self.errors = 0
+        self._sent_at = collections.deque()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._reader = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def connect(cls, session, url, code, latencies):
+        ws = await session.ws_connect(url)
+        await ws.send_json({"type": "auth", "code": code})
+        reply = await ws.receive_json()
+        if reply.get('type') != 'auth_success':
+            await ws.close()
+            raise RuntimeError("Replay client failed to authenticate")
+        return cls(ws, latencies)
+
+    async def send(self, frame):
+        self._idle.clear()
+        self._sent_at.append(time.perf_counter())
+        await self.ws.send_str(frame)
+
+    async def close(self):
+        """Waits for the replies to every sent frame, then closes the socket"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=10)
+        finally:
+            self._reader.cancel()
+            await self.ws.close()
+
+    async def _read_responses(self):
+        try:
+            async for msg in self.ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                received = time.perf_counter()
+                if json.loads(msg.data).get('type') == 'error':
+                    self.errors += 1
+                self.latencies.append((received - self._sent_at.popleft()) * 1000)
+                if not self._sent_at:
+                    self._idle.set()
+        finally:
+            # The server went away, nothing more will be answered
+            self._idle.set()
+
+
+async def _wait_for_connections(plugin, count):
+    """Waits until the server has unregistered every connection beyond `count`"""
+    while len(plugin.connection_manager.connections) > count:
+        await asyncio.sleep(0.001)
+
+
+async def replay(path, speed=1.0):
+    """Replays a trace against a local server and returns a report dict
+
+    Every recorded connection gets its own WebSocket, opened at its first frame
+    and closed after its last one. A speed of 0 sends frames back to back
+    without pacing.
+    """
+    if PLUGIN_DIR not in sys.path:
+        sys.path.insert(0, PLUGIN_DIR)
+    from main import Plugin
+
+    header, entries = read_trace(path)
+    # Recorded auth frames carry a stale code, the replay clients authenticate themselves
+    entries = [e for e in entries if not _is_auth(e[2])]
+    last_frames = {connection_id: index for index, (_, connection_id, _) in enumerate(entries)}
+
+    plugin = Plugin()
+    await plugin._main()
+    expected = _expected_events(entries, plugin.input_engine)
+    recorder = RecordingBackend()
+
+    async def install_recorder():
+        # Never probe the real injectors, nothing may reach the Deck's input
+        plugin.injector = recorder
+
+    plugin._select_injector = install_recorder
+    port = _free_port()
+    await plugin.start_server(port)
+
+    latencies = []
+    clients = {}
+    errors = 0
+    try:
+        async with aiohttp.ClientSession() as session:
+            start = time.perf_counter()
+            base_ms = entries[0][0] if entries else 0
+            for index, (t_ms, connection_id, frame) in enumerate(entries):
+                if speed > 0:
+                    delay = (t_ms - base_ms) / 1000 / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                client = clients.get(connection_id)
+                if client is None:
+                    client = clients[connection_id] = await _ReplayClient.connect(
+                        session, f'http://127.0.0.1:{port}/ws', plugin.access_code, latencies)
+                await client.send(frame)
+                if last_frames[connection_id] == index:
+                    await client.close()
+                    errors += client.errors
+                    del clients[connection_id]
+                    # Anything the server does on disconnect happens before the next frame
+                    await asyncio.wait_for(_wait_for_connections(plugin, len(clients)), timeout=10)
+            duration = time.perf_counter() - start
+        injected = list(recorder.events)
+    finally:
+        await plugin.stop_server()
+        await plugin._unload()
+
+    mismatches = [i for i, pair in enumerate(zip(expected, injected)) if pair[0] != pair[1]]
+    if mismatches:
+        first_mismatch = mismatches[0]
+    elif len(expected) != len(injected):
+        # One list is a prefix of the other, they part at the end of the shorter one
+        first_mismatch = min(len(expected), len(injected))
+    else:
+        first_mismatch = None
+    return {
+        "trace": path,
+        "recorded_at": header.get('started'),
+        "speed": speed,
+        "frames": len(entries),
+        "connections": len(last_frames),
+        "responses": len(latencies),
+        "errors": errors,
+        "original_duration_s": round((entries[-1][0] - entries[0][0]) / 1000, 3) if entries else 0,
+        "replay_duration_s": round(duration, 3),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": _percentile(latencies, 100),
+        },
+        "ordering": {
+            "expected": len(expected),
+            "injected": len(injected),
+            "mismatches": len(mismatches) + abs(len(expected) - len(injected)),
+            "first_mismatch": first_mismatch,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a Deckyboard input trace against a local server")
+    parser.add_argument('trace', help="Path to a trace file written by start_trace_recording")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Pace multiplier (1 = original pace, 0 = as fast as possible)")
+    args = parser.parse_args(argv)
+    report = asyncio.run(replay(args.trace, speed=args.speed))
+    print(json.dumps(report, indent=2))
+    return 0 if report['ordering']['mismatches'] == 0 and report['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
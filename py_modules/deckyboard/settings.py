@@ -0,0 +1,42 @@
+"""Persistent plugin settings stored as JSON in the plugin settings directory."""
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "keyboard_layout": None,
+    "injector_backend": None,
+}
+
+
+class Settings:
+    """Small JSON-backed key/value store, written on every change"""
+
+    def __init__(self, path=None):
+        if path is None:
+            settings_dir = os.environ.get('DECKY_PLUGIN_SETTINGS_DIR', tempfile.gettempdir())
+            path = os.path.join(settings_dir, 'settings.json')
+        self.path = path
+        self._values = dict(DEFAULTS)
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._values.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read settings from {path}: {e}")
+
+    def get(self, key):
+        return self._values.get(key, DEFAULTS.get(key))
+
+    def set(self, key, value):
+        self._values[key] = value
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self._values, f, indent=2)
+
+    def all(self):
+        return dict(self._values)
@@ -0,0 +1,46 @@
+"""Input trace recording.
+
+A trace is a JSON-lines file: one header object, then one compact
+``[t_ms, connection_id, frame]`` array per received WebSocket frame, where
+``t_ms`` is the receive time relative to the start of the recording.
+"""
+import json
+import os
+import time
+
+TRACE_FORMAT = "deckyboard-trace"
+TRACE_VERSION = 1
+
+
+class TraceRecorder:
+    """Appends received frames with their receive timestamp to a trace file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self._start = time.monotonic()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'w', encoding='utf-8')
+        header = {"format": TRACE_FORMAT, "version": TRACE_VERSION, "started": time.time()}
+        self._file.write(json.dumps(header) + '\n')
+
+    def record(self, connection_id, frame):
+        t_ms = round((time.monotonic() - self._start) * 1000, 3)
+        self._file.write(json.dumps([t_ms, connection_id, frame], separators=(',', ':')) + '\n')
+        self.frames += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_trace(path):
+    """Returns the header and the list of (t_ms, connection_id, frame) entries of a trace"""
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != TRACE_FORMAT:
+            raise ValueError(f"{path} is not a Deckyboard trace")
+        if header.get('version') != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version: {header.get('version')}")
+        entries = [tuple(json.loads(line)) for line in f if line.strip()]
+    return header, entries
@@ -0,0 +1,117 @@
+"""Event loop lag measurement and stall capture.
+
+A coroutine on the loop sleeps for a fixed interval and records how late it
+wakes up. A helper thread watches the coroutine's heartbeat; when the loop has
+not come back for longer than the threshold, it grabs the loop thread's stack
+so whatever was blocking can be identified.
+"""
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+
+INTERVAL = 0.1
+THRESHOLD = 0.1
+WINDOW = 600
+MAX_STALLS = 10
+
+# Upper bounds (ms) of the lag histogram buckets, the last one is open ended
+BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+class LoopWatchdog:
+    """Measures event loop lag and captures the stack of long stalls"""
+
+    def __init__(self, interval=INTERVAL, threshold=THRESHOLD, window=WINDOW, max_stalls=MAX_STALLS):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = collections.deque(maxlen=window)
+        self.stalls = collections.deque(maxlen=max_stalls)
+        self.stall_count = 0
+        self._beat = None
+        self._loop_thread = None
+        self._pending_stall = None
+        self._lock = threading.Lock()
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.ensure_future(self._measure())
+        self._thread = threading.Thread(target=self._watch, name="deckyboard-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.samples.append(lag * 1000)
+            with self._lock:
+                self._beat = now
+                stall, self._pending_stall = self._pending_stall, None
+            if stall:
+                stall["duration_ms"] = round(lag * 1000, 1)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            with self._lock:
+                overdue = time.monotonic() - self._beat - self.interval
+                if overdue < self.threshold or self._pending_stall:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                self._pending_stall = {
+                    "at": time.time(),
+                    "duration_ms": None,
+                    "stack": traceback.format_stack(frame),
+                }
+                self.stalls.append(self._pending_stall)
+                self.stall_count += 1
+
+    def histogram(self):
+        """Counts of lag samples in the rolling window per bucket"""
+        counts = collections.OrderedDict((f"<={b}ms", 0) for b in BUCKETS)
+        counts[f">{BUCKETS[-1]}ms"] = 0
+        labels = list(counts)
+        for lag in self.samples:
+            index = next((i for i, b in enumerate(BUCKETS) if lag <= b), len(BUCKETS))
+            counts[labels[index]] += 1
+        return dict(counts)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"lag_p50_ms": None, "lag_p99_ms": None, "lag_max_ms": None, "stalls": self.stall_count}
+        return {
+            "lag_p50_ms": round(ordered[len(ordered) // 2], 2),
+            "lag_p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            "lag_max_ms": round(ordered[-1], 2),
+            "stalls": self.stall_count,
+        }
+
+    def metrics(self):
+        return {
+            **self.summary(),
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": len(self.samples),
+            "histogram": self.histogram(),
+            "recent_stalls": list(self.stalls),
+        }
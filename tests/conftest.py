@@ -0,0 +1,8 @@
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Decky imports main.py from the plugin directory, with py_modules on the import path
+sys.path.insert(0, PLUGIN_DIR)
+sys.path.insert(0, os.path.join(PLUGIN_DIR, 'py_modules'))
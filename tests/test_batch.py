@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from deckyboard.injectors import RecordingBackend
+from deckyboard.keystate import KeyStateTracker
+from deckyboard.layouts import InputEngine
+from main import MAX_BATCH_DELAY, Plugin
+
+
+def _plugin():
+    plugin = Plugin()
+    plugin.injector = RecordingBackend()
+    plugin.key_state = KeyStateTracker()
+    plugin.input_engine = InputEngine('us')
+    return plugin
+
+
+def test_batch_is_injected_in_order():
+    plugin = _plugin()
+
+    asyncio.run(plugin.inject_batch([
+        {"type": "keydown", "key": "Enter", "t": 0},
+        {"type": "keydown", "key": "a", "t": 1},
+        {"type": "keyup", "key": "Enter", "t": 2},
+        {"type": "keydown", "key": "b", "t": 2},
+    ], client=1))
+
+    assert plugin.injector.events == [(28, 1), (30, 1), (30, 0), (28, 0), (48, 1), (48, 0)]
+
+
+def test_malformed_batch_events_are_skipped():
+    plugin = _plugin()
+
+    asyncio.run(plugin.inject_batch([
+        "a",
+        {"type": "keydown"},
+        {"type": "keydown", "key": ["a"]},
+        {"type": "keydown", "key": "a", "t": "soon"},
+    ], client=1))
+
+    assert plugin.injector.events == [(30, 1), (30, 0)]
+
+
+def test_batch_delays_are_capped():
+    plugin = _plugin()
+
+    start = time.monotonic()
+    asyncio.run(plugin.inject_batch([
+        {"type": "keydown", "key": "a", "t": 0},
+        {"type": "keydown", "key": "b", "t": 60000},
+        {"type": "keydown", "key": "c", "t": 1e300},
+    ], client=1))
+
+    assert time.monotonic() - start < 10 * MAX_BATCH_DELAY
+    assert len(plugin.injector.events) == 6
@@ -0,0 +1,71 @@
+import asyncio
+
+from aiohttp import WSCloseCode
+
+from deckyboard.connections import ConnectionManager
+from main import Plugin
+
+
+class FakeWebSocket:
+    def __init__(self, exception=None):
+        self.closed = False
+        self.close_code = None
+        self._exception = exception
+
+    def exception(self):
+        return self._exception
+
+    async def close(self, code=WSCloseCode.OK, message=b''):
+        self.closed = True
+        self.close_code = code
+
+
+class FakeRequest:
+    remote = '127.0.0.1'
+    transport = None
+
+
+def test_connection_over_the_limit_gets_a_503():
+    async def run():
+        plugin = Plugin()
+        plugin.connection_manager = ConnectionManager(max_connections=1)
+        plugin.connection_manager.register(FakeWebSocket(), FakeRequest())
+        return plugin.connection_manager, await plugin.websocket_handler(FakeRequest())
+
+    manager, response = asyncio.run(run())
+
+    assert manager.is_full()
+    assert response.status == 503
+    assert manager.stats()['rejected'] == 1
+
+
+def test_unauthenticated_connection_is_closed_at_the_auth_deadline():
+    async def run():
+        manager = ConnectionManager(auth_timeout=0.01)
+        late, authenticated = FakeWebSocket(), FakeWebSocket()
+        manager.register(late, FakeRequest())
+        manager.authenticated(manager.register(authenticated, FakeRequest()))
+        await asyncio.sleep(0.05)
+        return manager, late, authenticated
+
+    manager, late, authenticated = asyncio.run(run())
+
+    assert late.closed and late.close_code == WSCloseCode.POLICY_VIOLATION
+    assert not authenticated.closed
+    assert manager.reaped == 1
+
+
+def test_heartbeat_timeout_counts_as_reaped():
+    async def run():
+        manager = ConnectionManager()
+        timed_out = manager.register(FakeWebSocket(exception=asyncio.TimeoutError()), FakeRequest())
+        closed = manager.register(FakeWebSocket(), FakeRequest())
+        manager.unregister(timed_out)
+        manager.unregister(closed)
+        manager.unregister(timed_out)
+        return manager
+
+    manager = asyncio.run(run())
+
+    assert manager.connections == {}
+    assert manager.reaped == 1
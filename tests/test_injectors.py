@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from deckyboard import injectors
+from deckyboard.injectors import InjectorBackend, select_backend
+from main import Plugin
+
+
+def _fake_backend(backend_name, is_available=True, delay=0.0, fails=False):
+    class FakeBackend(InjectorBackend):
+        name = backend_name
+        instances = []
+
+        def __init__(self):
+            self.closed = False
+            self.instances.append(self)
+
+        async def available(self):
+            return is_available
+
+        async def send(self, events):
+            if fails:
+                raise RuntimeError("injection failed")
+            await asyncio.sleep(delay)
+
+        def close(self):
+            self.closed = True
+
+    return FakeBackend
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    fakes = {
+        'slow': _fake_backend('slow', delay=0.005),
+        'fast': _fake_backend('fast'),
+        'missing': _fake_backend('missing', is_available=False),
+        'broken': _fake_backend('broken', fails=True),
+    }
+    monkeypatch.setattr(injectors, 'BACKENDS', fakes)
+    monkeypatch.setattr(injectors, 'PROBED_BACKENDS', ['slow', 'fast', 'missing', 'broken'])
+    return fakes
+
+
+def test_picks_the_fastest_available_backend(backends):
+    backend, measurements = asyncio.run(select_backend())
+
+    assert backend.name == 'fast'
+    assert measurements['missing'] is None
+    assert measurements['broken'] is None
+    assert measurements['fast'] < measurements['slow']
+    assert backends['slow'].instances[0].closed
+    assert not backend.closed
+
+
+def test_preferred_backend_wins_over_latency(backends):
+    backend, _ = asyncio.run(select_backend('slow'))
+
+    assert backend.name == 'slow'
+    assert backends['fast'].instances[0].closed
+
+
+def test_unavailable_preferred_backend_falls_back_to_fastest(backends):
+    backend, measurements = asyncio.run(select_backend('missing'))
+
+    assert backend.name == 'fast'
+    assert measurements['missing'] is None
+
+
+def test_unknown_preferred_backend_is_ignored(backends):
+    backend, measurements = asyncio.run(select_backend('recording'))
+
+    assert backend.name == 'fast'
+    assert 'recording' not in measurements
+
+
+def test_nothing_available(backends, monkeypatch):
+    monkeypatch.setattr(injectors, 'PROBED_BACKENDS', ['missing', 'broken'])
+
+    backend, measurements = asyncio.run(select_backend())
+
+    assert backend is None
+    assert measurements == {'missing': None, 'broken': None}
+
+
+def test_recording_backend_cannot_be_configured():
+    result = asyncio.run(Plugin().set_injector_backend('recording'))
+
+    assert not result['success']
@@ -0,0 +1,43 @@
+from deckyboard.keystate import KeyStateTracker
+
+
+def test_duplicate_keydown_is_dropped():
+    tracker = KeyStateTracker()
+
+    assert tracker.press(1, 'ArrowUp')
+    assert not tracker.press(1, 'ArrowUp')
+    assert tracker.dropped == 1
+
+
+def test_orphaned_keyup_is_dropped():
+    tracker = KeyStateTracker()
+
+    assert not tracker.release(1, 'Enter')
+    assert tracker.press(1, 'Enter')
+    assert tracker.release(1, 'Enter')
+    assert not tracker.release(1, 'Enter')
+    assert tracker.dropped == 2
+
+
+def test_key_held_by_several_clients_is_released_by_the_last_one():
+    tracker = KeyStateTracker()
+
+    assert tracker.press(1, 'Escape')
+    assert not tracker.press(2, 'Escape')
+    assert not tracker.release(1, 'Escape')
+    assert tracker.release(2, 'Escape')
+    assert tracker.stats()['held'] == []
+
+
+def test_release_all_returns_only_keys_no_other_client_holds():
+    tracker = KeyStateTracker()
+    tracker.press(1, 'ArrowUp')
+    tracker.press(1, 'Backspace')
+    tracker.press(2, 'Backspace')
+
+    assert tracker.release_all(1) == ['ArrowUp']
+    assert tracker.release_all(1) == []
+    # Client 2's redundant press, then client 1 letting go of a key client 2 still holds
+    assert tracker.stats() == {'held': ['Backspace'], 'clients': {2: ['Backspace']}, 'dropped': 2}
+    assert tracker.release_all(2) == ['Backspace']
+    assert tracker.clients == {}
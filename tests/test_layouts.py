@@ -0,0 +1,70 @@
+from deckyboard.layouts import (KEY_LEFTCTRL, KEY_LEFTSHIFT, KEY_RIGHTALT, KEY_SPACE, LAYOUTS, ROWS,
+                                InputEngine, build_table)
+
+
+def test_layout_rows_match_keycodes():
+    for layout, levels in LAYOUTS.items():
+        for level, rows in levels.items():
+            for codes, chars in zip(ROWS, rows):
+                assert len(chars) == len(codes), (layout, level, chars)
+
+
+def test_plain_and_shifted_characters():
+    table = build_table('us')
+
+    assert table['a'] == ((30, ()),)
+    assert table['A'] == ((30, (KEY_LEFTSHIFT,)),)
+    assert table[' '] == ((KEY_SPACE, ()),)
+
+
+def test_altgr_characters():
+    assert build_table('de')['@'] == ((16, (KEY_RIGHTALT,)),)
+
+
+def test_dead_key_compositions():
+    table = build_table('fr')
+
+    # Circumflex is a dead key on the base level of AD11, diaeresis on its shift level
+    assert table['ê'] == ((26, ()), (18, ()))
+    assert table['Ê'] == ((26, ()), (18, (KEY_LEFTSHIFT,)))
+    assert table['ë'] == ((26, (KEY_LEFTSHIFT,)), (18, ()))
+    # A dead key followed by space types the spacing accent
+    assert table['¨'] == ((26, (KEY_LEFTSHIFT,)), (KEY_SPACE, ()))
+    # Characters with their own key are not rebuilt from a dead key
+    assert table['é'] == ((3, ()),)
+
+
+def test_events_press_and_release_modifiers_around_the_key():
+    engine = InputEngine('us')
+
+    assert engine.events('A') == ((KEY_LEFTSHIFT, 1), (30, 1), (30, 0), (KEY_LEFTSHIFT, 0))
+
+
+def test_unicode_entry_for_characters_outside_the_layout():
+    engine = InputEngine('us')
+
+    # U+0436: Ctrl+Shift+U, then "436", then space
+    assert engine.events('ж') == (
+        (KEY_LEFTCTRL, 1), (KEY_LEFTSHIFT, 1), (22, 1), (22, 0), (KEY_LEFTSHIFT, 0), (KEY_LEFTCTRL, 0),
+        (5, 1), (5, 0), (4, 1), (4, 0), (7, 1), (7, 0),
+        (KEY_SPACE, 1), (KEY_SPACE, 0),
+    )
+
+
+def test_only_layout_characters_are_cached():
+    engine = InputEngine('us')
+
+    assert engine.events('a') is engine.events('a')
+    engine.events('ж')
+    assert 'ж' not in engine._events
+
+
+def test_unicode_entry_uses_the_layout_for_hex_digits():
+    # Digits need Shift on AZERTY
+    events = InputEngine('fr').events('ж')
+
+    assert events[6:10] == ((KEY_LEFTSHIFT, 1), (5, 1), (5, 0), (KEY_LEFTSHIFT, 0))
+
+
+def test_unknown_layout_falls_back_to_us():
+    assert InputEngine('xx').layout == 'us'
@@ -0,0 +1,60 @@
+import asyncio
+
+from deckyboard.trace import TraceRecorder
+from deckyboard.replay import replay
+
+
+def _write_trace(path, frames):
+    recorder = TraceRecorder(str(path))
+    for connection_id, frame in frames:
+        recorder.record(connection_id, frame)
+    recorder.close()
+    return str(path)
+
+
+def test_replay_opens_one_connection_per_recorded_client(tmp_path):
+    path = _write_trace(tmp_path / 'trace.jsonl', [
+        (1, '{"type":"auth"}'),
+        (2, '{"type":"auth"}'),
+        (1, '{"type":"keydown","key":"Escape"}'),
+        (2, '{"type":"keydown","key":"Escape"}'),
+        (1, '{"type":"keyup","key":"Escape"}'),
+        (2, '{"type":"batch","events":[{"type":"keydown","key":"a"},{"type":"keyup","key":"Escape","t":1}]}'),
+        (1, '{"type":"keydown","key":"b"}'),
+    ])
+
+    report = asyncio.run(replay(path, speed=0))
+
+    assert report['connections'] == 2
+    assert report['frames'] == report['responses'] == 5
+    assert report['errors'] == 0
+    assert report['ordering'] == {"expected": 6, "injected": 6, "mismatches": 0, "first_mismatch": None}
+
+
+def test_replay_skips_malformed_events_like_the_server(tmp_path):
+    path = _write_trace(tmp_path / 'trace.jsonl', [
+        (1, '{"type":"batch","events":"abc"}'),
+        (1, '{"type":"batch","events":[1,{"type":"keydown","key":["a"]},{"type":"keydown","key":"a"}]}'),
+        (1, '["keydown"]'),
+    ])
+
+    report = asyncio.run(replay(path, speed=0))
+
+    assert report['responses'] == 3
+    assert report['errors'] == 2
+    assert report['ordering'] == {"expected": 2, "injected": 2, "mismatches": 0, "first_mismatch": None}
+
+
+def test_replay_expects_held_keys_to_be_released_on_disconnect(tmp_path):
+    path = _write_trace(tmp_path / 'trace.jsonl', [
+        (1, '{"type":"keydown","key":"Escape"}'),
+        (2, '{"type":"keydown","key":"Escape"}'),
+        (2, '{"type":"keydown","key":"ArrowUp"}'),
+        (1, '{"type":"keydown","key":"a"}'),
+        (2, '{"type":"batch","events":[{"type":"keydown","key":"b"},{"type":"keydown","key":"ArrowDown"}]}'),
+    ])
+
+    report = asyncio.run(replay(path, speed=0))
+
+    # Escape is still held by client 2 when client 1 leaves, then both arrows and Escape are released
+    assert report['ordering'] == {"expected": 10, "injected": 10, "mismatches": 0, "first_mismatch": None}
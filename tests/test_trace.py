@@ -0,0 +1,32 @@
+import pytest
+
+from deckyboard.trace import TraceRecorder, read_trace
+
+
+def test_read_trace_round_trip(tmp_path):
+    path = str(tmp_path / 'traces' / 'trace.jsonl')
+    recorder = TraceRecorder(path)
+    recorder.record(1, '{"type":"auth"}')
+    recorder.record(1, '{"type": "keydown", "key": "é"}')
+    recorder.record(2, '{"type":"keyup","key":"Enter"}')
+    recorder.close()
+
+    header, entries = read_trace(path)
+
+    assert header['format'] == 'deckyboard-trace'
+    assert recorder.frames == 3
+    assert [(c, f) for _, c, f in entries] == [
+        (1, '{"type":"auth"}'),
+        (1, '{"type": "keydown", "key": "é"}'),
+        (2, '{"type":"keyup","key":"Enter"}'),
+    ]
+    timestamps = [t for t, _, _ in entries]
+    assert timestamps == sorted(timestamps)
+
+
+def test_read_trace_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.jsonl'
+    path.write_text('{"format": "something-else"}\n')
+
+    with pytest.raises(ValueError):
+        read_trace(str(path))